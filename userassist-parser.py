@@ -1,13 +1,47 @@
 import argparse
+import array
 import os
-import codecs
 import struct
 from datetime import datetime, timedelta
 import csv
 import json
-from pathlib import Path
+from collections import deque
+from itertools import chain, islice
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 from Registry import Registry
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# FILETIMEs are read as signed int64 so they map directly onto datetime64;
+# values with the top bit set were never representable dates anyway
+_WIN7_STRUCT = struct.Struct("<4xI4xI44xq")
+_XP_STRUCT = struct.Struct("<4xIq")
+
+_FIELDNAMES = ('username', 'name', 'last_execution', 'guid',
+               'count', 'focus_time', 'source_file')
+
+_ROT13 = str.maketrans(
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz",
+    "NOPQRSTUVWXYZABCDEFGHIJKLMnopqrstuvwxyzabcdefghijklm")
+
+# Microseconds between the Windows (1601-01-01) and Unix (1970-01-01) epochs
+_EPOCH_DELTA_US = 11644473600 * 1000000
+# Largest FILETIME offset (in microseconds) that datetime can still represent
+_MAX_FILETIME_US = (datetime(9999, 12, 31, 23, 59, 59, 999999)
+                    - datetime(1601, 1, 1)) // timedelta(microseconds=1)
+
+class HiveProcessingError(Exception):
+    """Raised when the worker pool fails to return the results of a hive."""
+
 def create_help_text():
     """Create detailed help text for the script."""
     help_text = """
@@ -21,6 +55,7 @@ Description:
 
 Features:
     - Recursive scanning of directories for NTUSER.DAT files
+    - Parallel parsing of NTUSER.DAT files across CPU cores
     - Support for both Windows 7+ and XP UserAssist formats
     - UTC timestamp conversion
     - Multiple output formats (CSV and JSON)
@@ -29,6 +64,10 @@ Features:
 Required Dependencies:
     - python-registry (pip install python-registry)
 
+Optional Dependencies:
+    - numpy (pip install numpy) - faster bulk timestamp conversion
+    - orjson (pip install orjson) - faster JSON output
+
 Usage Examples:
     1. Basic usage with CSV output (default):
        python userassist_parser.py -i "C:\\Users" -o "C:\\Output"
@@ -57,64 +96,97 @@ Note: All timestamps are in UTC format (YYYY-MM-DD HH:MM:SS)
 
 def rot13_decode(encoded_string):
     """Decode ROT13 encoded string."""
-    return codecs.decode(encoded_string, 'rot_13')
+    return encoded_string.translate(_ROT13)
+
+def rot13_decode_all(encoded_strings):
+    """Decode a list of ROT13 encoded strings with a single translate call."""
+    decoded_strings = '\x00'.join(encoded_strings).translate(_ROT13).split('\x00')
+    if len(decoded_strings) != len(encoded_strings):
+        # A string contained the separator (or the list was empty)
+        return [rot13_decode(encoded_string) for encoded_string in encoded_strings]
+    return decoded_strings
+
+def _format_utc(seconds):
+    """Format seconds since the Unix epoch as a 'YYYY-MM-DD HH:MM:SS' string."""
+    days, seconds = divmod(seconds, 86400)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    
+    # Howard Hinnant's civil_from_days, avoiding datetime and strftime
+    days += 719468
+    era = days // 146097
+    day_of_era = days - era * 146097
+    year_of_era = (day_of_era - day_of_era // 1460 + day_of_era // 36524
+                   - day_of_era // 146096) // 365
+    day_of_year = day_of_era - (365 * year_of_era + year_of_era // 4 - year_of_era // 100)
+    month_index = (5 * day_of_year + 2) // 153
+    day = day_of_year - (153 * month_index + 2) // 5 + 1
+    month = month_index + 3 if month_index < 10 else month_index - 9
+    year = year_of_era + era * 400 + (month <= 2)
+    return f"{year:04d}-{month:02d}-{day:02d} {hours:02d}:{minutes:02d}:{seconds:02d}"
 
 def convert_filetime(filetime):
     """Convert Windows FILETIME to UTC datetime with specified format."""
-    if filetime == 0:
+    microseconds = filetime // 10
+    if microseconds == 0:
         return "Never"
-    try:
-        filetime = struct.unpack("<Q", struct.pack("<Q", filetime))[0]
-        microseconds = filetime // 10
-        if microseconds == 0:
-            return "Never"
-        
-        windows_epoch = datetime(1601, 1, 1)
-        timestamp = windows_epoch + timedelta(microseconds=microseconds)
-        return timestamp.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception as e:
-        print(f"Error converting timestamp: {e}")
+    if not 0 < microseconds <= _MAX_FILETIME_US:
         return "Invalid timestamp"
+    return _format_utc((microseconds - _EPOCH_DELTA_US) // 1000000)
 
 def convert_focus_time_to_utc(milliseconds):
     """Convert focus time milliseconds to UTC datetime format."""
-    try:
-        if milliseconds == 0:
-            return "Never"
-        unix_epoch = datetime(1970, 1, 1)
-        delta = timedelta(milliseconds=milliseconds)
-        timestamp = unix_epoch + delta
-        return timestamp.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception as e:
-        print(f"Error converting focus time: {e}")
-        return "Invalid focus time"
+    if milliseconds == 0:
+        return "Never"
+    return _format_utc(milliseconds // 1000)
+
+def _datetime64_to_strings(timestamps):
+    """Format a datetime64 array as 'YYYY-MM-DD HH:MM:SS' strings."""
+    # Every in-range timestamp is exactly 19 characters, so the ISO 'T'
+    # separator can be overwritten in place through a per-character view
+    strings = np.datetime_as_string(timestamps, unit='s').astype('U19')
+    strings.view('U1').reshape(-1, 19)[:, 10] = ' '
+    return strings
+
+def convert_filetimes(filetimes):
+    """Convert a sequence of Windows FILETIMEs to UTC datetime strings in bulk."""
+    if np is None or not filetimes:
+        return [convert_filetime(filetime) for filetime in filetimes]
+    
+    # An array('q') of FILETIMEs is wrapped without copying
+    microseconds = np.asarray(filetimes, dtype=np.int64) // 10
+    valid = (microseconds >= 0) & (microseconds <= _MAX_FILETIME_US)
+    unix_us = np.where(valid, microseconds, 0) - _EPOCH_DELTA_US
+    timestamps = _datetime64_to_strings(unix_us.view('datetime64[us]'))
+    timestamps = np.where(valid, timestamps, 'Invalid timestamp')
+    return np.where(microseconds == 0, 'Never', timestamps).tolist()
+
+def convert_focus_times(focus_times):
+    """Convert a sequence of focus time milliseconds to UTC datetime strings in bulk."""
+    if np is None or not focus_times:
+        return [convert_focus_time_to_utc(milliseconds) for milliseconds in focus_times]
+    
+    milliseconds = np.asarray(focus_times, dtype=np.int64)
+    timestamps = _datetime64_to_strings(milliseconds.view('datetime64[ms]'))
+    return np.where(milliseconds == 0, 'Never', timestamps).tolist()
 
 def parse_userassist_entry(data, win7_format=True):
-    """Parse UserAssist entry data."""
+    """Parse UserAssist entry data into a raw (count, focus_time, last_execution) tuple.
+    
+    focus_time is None for XP format entries, which do not record it.
+    """
     if win7_format:
         try:
             if len(data) >= 72:
-                count = struct.unpack("<I", data[4:8])[0]
-                focus_time = struct.unpack("<I", data[12:16])[0]
-                last_execution = struct.unpack("<Q", data[60:68])[0]
-                
-                return {
-                    'count': count,
-                    'focus_time': convert_focus_time_to_utc(focus_time),
-                    'last_execution': convert_filetime(last_execution)
-                }
+                return _WIN7_STRUCT.unpack_from(data)
         except struct.error as e:
             print(f"Error parsing Win7+ format: {e}")
             return None
     else:
         try:
             if len(data) >= 16:
-                count = struct.unpack("<I", data[4:8])[0]
-                last_execution = struct.unpack("<Q", data[8:16])[0]
-                return {
-                    'count': count,
-                    'last_execution': convert_filetime(last_execution)
-                }
+                count, last_execution = _XP_STRUCT.unpack_from(data)
+                return count, None, last_execution
         except struct.error as e:
             print(f"Error parsing XP format: {e}")
             return None
@@ -123,17 +195,35 @@ def parse_userassist_entry(data, win7_format=True):
 def find_ntuser_dat_files(root_path):
     """Recursively find all NTUSER.DAT files."""
     ntuser_files = []
-    for path in Path(root_path).rglob('NTUSER.DAT'):
-        ntuser_files.append(str(path))
+    pending_dirs = [root_path]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        subdirs = []
+        try:
+            with os.scandir(current_dir) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.upper() == 'NTUSER.DAT':
+                        ntuser_files.append(entry.path)
+        except OSError:
+            continue
+        # Push subdirectories reversed so they are visited in listing order,
+        # keeping the same preorder that Path.rglob produced
+        pending_dirs.extend(reversed(subdirs))
     return ntuser_files
 
 def parse_userassist(ntuser_path):
     """Parse UserAssist entries from NTUSER.DAT file."""
-    userassist_data = []
+    print(f"Processing: {ntuser_path}")
+    pending_entries = []
+    names = []
+    filetimes = array.array('q')
+    focus_times = []
     
     try:
         registry = Registry.Registry(ntuser_path)
-        username = Path(ntuser_path).parent.name
+        username = os.path.basename(os.path.dirname(ntuser_path))
         
         try:
             userassist_key = registry.open(r"Software\Microsoft\Windows\CurrentVersion\Explorer\UserAssist")
@@ -141,39 +231,45 @@ def parse_userassist(ntuser_path):
             for guid_key in userassist_key.subkeys():
                 guid = guid_key.name()
                 
-                try:
-                    version_value = guid_key.value("Version").value()
-                    win7_format = version_value >= 5
-                except Registry.RegistryValueNotFoundException:
-                    win7_format = False
+                # Index values and subkeys by name once rather than relying on
+                # lookups that raise for the common missing-entry case
+                values = {value.name().lower(): value for value in guid_key.values()}
+                version_value = values['version'].value() if 'version' in values else 0
+                win7_format = version_value >= 5
                 
-                try:
-                    count_key = guid_key.subkey("Count")
-                    
-                    for value in count_key.values():
-                        name = value.name()
-                        data = value.value()
-                        
-                        if not data:
-                            continue
-                        
-                        decoded_name = rot13_decode(name)
-                        parsed_data = parse_userassist_entry(data, win7_format)
-                        
-                        if parsed_data:
-                            entry = {
-                                'username': username,
-                                'name': decoded_name,
-                                'last_execution': parsed_data['last_execution'],
-                                'guid': guid,
-                                'count': parsed_data['count'],
-                                'focus_time': parsed_data.get('focus_time', 'N/A'),
-                                'source_file': ntuser_path
-                            }
-                            userassist_data.append(entry)
-                            
-                except Registry.RegistryKeyNotFoundException:
+                subkeys = {subkey.name().lower(): subkey for subkey in guid_key.subkeys()}
+                count_key = subkeys.get('count')
+                if count_key is None:
                     continue
+                
+                for value in count_key.values():
+                    name = value.name()
+                    data = value.value()
+                    
+                    if not data:
+                        continue
+                    
+                    parsed_entry = parse_userassist_entry(data, win7_format)
+                    
+                    if parsed_entry:
+                        count, focus_time, last_execution = parsed_entry
+                        pending_entries.append((guid, count, win7_format))
+                        names.append(name)
+                        filetimes.append(last_execution)
+                        if win7_format:
+                            focus_times.append(focus_time)
+            
+            # Names and timestamps are converted per hive in one pass rather than per entry
+            decoded_names = rot13_decode_all(names)
+            last_executions = convert_filetimes(filetimes)
+            converted_focus_times = iter(convert_focus_times(focus_times))
+            # Rows are plain tuples in _FIELDNAMES order
+            userassist_data = [
+                (username, decoded_name, last_execution, guid, count,
+                 next(converted_focus_times) if win7_format else 'N/A', ntuser_path)
+                for (guid, count, win7_format), decoded_name, last_execution
+                in zip(pending_entries, decoded_names, last_executions)
+            ]
                     
         except Registry.RegistryKeyNotFoundException:
             print(f"UserAssist key not found in {ntuser_path}")
@@ -185,34 +281,94 @@ def parse_userassist(ntuser_path):
     
     return userassist_data
 
-def write_csv_results(all_data, output_file):
-    """Write results to CSV file."""
+def iter_userassist(ntuser_files):
+    """Yield the parsed UserAssist entries of each NTUSER.DAT file in order."""
+    max_workers = os.cpu_count() or 1
+    if os.name == 'nt':
+        # ProcessPoolExecutor rejects more than 61 workers on Windows
+        max_workers = min(max_workers, 61)
+    
+    # Each hive is independent, so parse them across worker processes, but
+    # keep only a bounded window in flight so finished hives cannot pile up
+    # in memory behind a slow one while results are written in order
+    pending_files = iter(ntuser_files)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque(executor.submit(parse_userassist, ntuser_file)
+                        for ntuser_file in islice(pending_files, 2 * max_workers))
+        while pending:
+            try:
+                parsed_data = pending.popleft().result()
+                for ntuser_file in islice(pending_files, 1):
+                    pending.append(executor.submit(parse_userassist, ntuser_file))
+            except Exception as e:
+                # parse_userassist handles its own errors, so anything raised
+                # here is a pool failure (e.g. BrokenProcessPool)
+                raise HiveProcessingError(f"Error processing NTUSER.DAT files: {e}") from e
+            if parsed_data:
+                yield parsed_data
+
+@contextmanager
+def _open_output(output_file, mode, **kwargs):
+    """Open a temporary file that replaces output_file only once writing completes."""
+    partial_file = output_file + '.partial'
+    try:
+        with open(partial_file, mode, **kwargs) as f:
+            yield f
+        os.replace(partial_file, output_file)
+    except BaseException:
+        if os.path.exists(partial_file):
+            os.remove(partial_file)
+        raise
+
+def write_csv_results(results, output_file):
+    """Stream per-file results to CSV file, returning the number of entries written."""
+    total_entries = 0
     try:
-        with open(output_file, 'w', newline='', encoding='utf-8') as f:
-            if all_data:
-                fieldnames = ['username', 'name', 'last_execution', 'guid', 
-                            'count', 'focus_time', 'source_file']
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                writer.writerows(all_data)
+        with _open_output(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(_FIELDNAMES)
+            for parsed_data in results:
+                writer.writerows(parsed_data)
+                total_entries += len(parsed_data)
         
         print(f"Successfully wrote results to {output_file}")
-        return True
+        return total_entries
+    except HiveProcessingError as e:
+        print(str(e))
+        return None
     except Exception as e:
         print(f"Error writing CSV output: {str(e)}")
-        return False
+        return None
 
-def write_json_results(all_data, output_file):
-    """Write results to JSON file."""
+def _dump_json(entries):
+    """Serialize entries to an indented UTF-8 JSON array."""
+    if orjson is not None:
+        return orjson.dumps(entries, option=orjson.OPT_INDENT_2)
+    return json.dumps(entries, indent=2, ensure_ascii=False).encode('utf-8')
+
+def write_json_results(results, output_file):
+    """Stream per-file results to JSON file, returning the number of entries written."""
+    total_entries = 0
     try:
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(all_data, f, indent=4)
+        with _open_output(output_file, 'wb') as f:
+            f.write(b'[')
+            for parsed_data in results:
+                # Drop the enclosing brackets so each file's entries continue
+                # the single top-level array with consistent indentation
+                f.write(b',\n' if total_entries else b'\n')
+                entries = [dict(zip(_FIELDNAMES, row)) for row in parsed_data]
+                f.write(_dump_json(entries)[2:-2])
+                total_entries += len(parsed_data)
+            f.write(b'\n]' if total_entries else b']')
         
         print(f"Successfully wrote results to {output_file}")
-        return True
+        return total_entries
+    except HiveProcessingError as e:
+        print(str(e))
+        return None
     except Exception as e:
         print(f"Error writing JSON output: {str(e)}")
-        return False
+        return None
 
 def main():
     parser = argparse.ArgumentParser(
@@ -254,26 +410,27 @@ def main():
     
     print(f"Found {len(ntuser_files)} NTUSER.DAT files")
     
-    all_data = []
-    for ntuser_file in ntuser_files:
-        print(f"Processing: {ntuser_file}")
-        parsed_data = parse_userassist(ntuser_file)
-        if parsed_data:
-            all_data.extend(parsed_data)
+    results = iter_userassist(ntuser_files)
+    try:
+        first_result = next(results, None)
+    except HiveProcessingError as e:
+        print(str(e))
+        return
     
-    if all_data:
+    if first_result is not None:
         os.makedirs(args.output, exist_ok=True)
+        results = chain([first_result], results)
         
         if args.format == 'json':
             output_file = os.path.join(args.output, 'userassist_parsed.json')
-            success = write_json_results(all_data, output_file)
+            total_entries = write_json_results(results, output_file)
         else:
             output_file = os.path.join(args.output, 'userassist_parsed.csv')
-            success = write_csv_results(all_data, output_file)
+            total_entries = write_csv_results(results, output_file)
             
-        if success:
+        if total_entries is not None:
             print(f"\nSummary:")
-            print(f"- Total entries parsed: {len(all_data)}")
+            print(f"- Total entries parsed: {total_entries}")
             print(f"- Output file: {output_file}")
             print(f"- Format: {args.format.upper()}")
     else: